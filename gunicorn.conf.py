@@ -0,0 +1,14 @@
+# gunicorn配置，用法: gunicorn -c gunicorn.conf.py main:app
+import multiprocessing
+import os
+
+bind = '0.0.0.0:5000'
+workers = multiprocessing.cpu_count()
+worker_class = 'gthread'
+# 与main.py共用REQUEST_THREADS，上游线程池按同样的线程数分配
+threads = int(os.environ.get('REQUEST_THREADS', 8))
+timeout = 120
+# 在master进程里导入一次应用，worker直接fork共享
+preload_app = True
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
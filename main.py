@@ -1,13 +1,60 @@
 from flask import Flask, request, jsonify ,redirect ,Response
+import gzip
 import json
 import os
+import re
+import threading
+import time
 import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache, wraps
 from hashlib import md5
 from random import randrange
 import requests
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from cryptography.hazmat.primitives import padding
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
+COOKIE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cookie.txt')
+_cookie_cache = None
+_cookie_lock = threading.Lock()
+ID_RE = re.compile(r'[?&#]id=(\d+)')
+SIZE_UNITS = ("B", "KB", "MB", "GB", "TB", "PB")
+COMPRESS_MIMETYPES = ('application/json', 'text/html')
+COMPRESS_MIN_SIZE = 500
+# 上游接口超时时间（秒），避免卡住的连接长期占用线程
+UPSTREAM_TIMEOUT = 10
+QUALITY_NAMES = {
+    'standard': "标准音质",
+    'exhigh': "极高音质",
+    'lossless': "无损音质",
+    'hires': "Hires音质",
+    'sky': "沉浸环绕声",
+    'jyeffect': "高清环绕声",
+    'jymaster': "超清母带",
+}
+VALID_LEVELS = frozenset(QUALITY_NAMES)
+VALID_LEVELS_MSG = '无效的level参数，支持: ' + ', '.join(QUALITY_NAMES)
+VALID_TYPES = frozenset(('text', 'down', 'json'))
+VALID_TYPES_MSG = '无效的type参数，支持: text, down, json'
+
+# 复用连接池，避免每次请求都重新建立TCP/TLS连接；不保存上游下发的cookie
+session = requests.Session()
+session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64,
+                      max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504)))
+session.mount('https://', adapter)
+session.mount('http://', adapter)
+
+# 并发请求上游接口用的线程池。每个请求在池里占用2个线程（url_v1在请求线程内执行），
+# 按服务器的请求线程数预留，避免请求在池里排队；线程数由环境变量REQUEST_THREADS指定，
+# gunicorn.conf.py也读取同一个变量
+REQUEST_THREADS = int(os.environ.get('REQUEST_THREADS', 8))
+executor = ThreadPoolExecutor(max_workers=REQUEST_THREADS * 2)
+
 def HexDigest(data):
     return "".join([hex(d)[2:].zfill(2) for d in data])
 
@@ -19,16 +66,45 @@ def HashHexDigest(text):
     return HexDigest(HashDigest(text))
 
 def parse_cookie(text: str):
-    cookie_ = [item.strip().split('=', 1) for item in text.strip().split(';') if item]
-    cookie_ = {k.strip(): v.strip() for k, v in cookie_}
+    # 单次扫描解析，不生成split的中间列表；没有分号时按行分隔
+    cookie_ = {}
+    delim = ';' if ';' in text else '\n'
+    pos, n = 0, len(text)
+    while pos < n:
+        end = text.find(delim, pos)
+        if end < 0:
+            end = n
+        eq = text.find('=', pos, end)
+        if eq >= 0:
+            key = text[pos:eq].strip()
+            if key:
+                cookie_[key] = text[eq + 1:end].strip()
+        pos = end + 1
     return cookie_
 
-def read_cookie():
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    cookie_file = os.path.join(script_dir, 'cookie.txt')
-    with open(cookie_file, 'r') as f:
-        cookie_contents = f.read()
-    return cookie_contents
+def read_cookie(length=None):
+    # cookie文件很小，直接一次os.read读完，跳过缓冲层
+    fd = os.open(COOKIE_FILE, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        if length is None:
+            length = os.fstat(fd).st_size
+        cookie_contents = os.read(fd, length)
+    finally:
+        os.close(fd)
+    return cookie_contents.decode('utf-8')
+
+def get_cookies():
+    # 仅在cookie.txt的修改时间或大小变化时重新读取解析
+    global _cookie_cache
+    st = os.stat(COOKIE_FILE)
+    key = (st.st_mtime_ns, st.st_size)
+    cache = _cookie_cache
+    if cache is not None and cache[0] == key:
+        return cache[1]
+    with _cookie_lock:
+        if _cookie_cache is None or _cookie_cache[0] != key:
+            _cookie_cache = (key, parse_cookie(read_cookie(st.st_size)))
+        return _cookie_cache[1]
 
 def post(url, params, cookie):
     headers = {
@@ -42,48 +118,94 @@ def post(url, params, cookie):
         "deviceId": "pyncm!"
     }
     cookies.update(cookie)
-    response = requests.post(url, headers=headers, cookies=cookies, data={"params": params})
+    response = session.post(url, headers=headers, cookies=cookies, data={"params": params}, timeout=UPSTREAM_TIMEOUT)
     return response.text
 
-# 输入id选项
+# 解析163cn.tv短链，只缓存成功的结果；没有跳转地址时抛出ValueError，不会被lru_cache缓存
+@lru_cache(maxsize=4096)
+def resolve_short_link(url):
+    response = session.head(url, allow_redirects=False, timeout=UPSTREAM_TIMEOUT)
+    location = response.headers.get('Location')
+    if not location:
+        raise ValueError('短链解析失败: %s' % url)
+    return location
+
+# 输入id选项，短链无法解析时返回None
 def ids(ids):
     if '163cn.tv' in ids:
-        response = requests.get(ids, allow_redirects=False)
-        ids = response.headers.get('Location')
+        try:
+            ids = resolve_short_link(ids)
+        except ValueError:
+            return None
     if 'music.163.com' in ids:
-        index = ids.find('id=') + 3
-        ids = ids[index:].split('&')[0]
+        match = ID_RE.search(ids)
+        if match:
+            ids = match.group(1)
     return ids
 
 #转换文件大小
 def size(value):
-     units = ["B", "KB", "MB", "GB", "TB", "PB"]
-     size = 1024.0
-     for i in range(len(units)):
-         if (value / size) < 1:
-             return "%.2f%s" % (value, units[i])
-         value = value / size
-     return value
+    # 用bit_length直接定位单位，不再循环除以1024
+    i = min(max(int(value).bit_length() - 1, 0) // 10, len(SIZE_UNITS) - 1)
+    return "%.2f%s" % (value / (1 << (i * 10)), SIZE_UNITS[i])
 
 #转换音质
 def music_level1(value):
-    if value == 'standard':
-        return "标准音质"
-    elif value == 'exhigh':
-        return "极高音质"
-    elif value == 'lossless':
-        return "无损音质"
-    elif value == 'hires':
-        return "Hires音质"
-    elif value == 'sky':
-        return "沉浸环绕声"
-    elif value == 'jyeffect':
-        return "高清环绕声"
-    elif value == 'jymaster':
-        return "超清母带"
-    else:
-        return "未知音质"
+    return QUALITY_NAMES.get(value, "未知音质")
+
+def response_ok(value):
+    return value.get('code') == 200
 
+def ttl_cache(ttl, maxsize=1024, cacheable=response_ok):
+    # 进程内带过期时间的LRU缓存，用于缓存上游接口返回；
+    # 相同参数的并发调用只请求一次上游，其余等待同一个结果。
+    # 只缓存cacheable判定为成功的返回，上游报错/限流时下次请求会重试
+    def decorator(func):
+        cache = OrderedDict()
+        inflight = {}
+        lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper(*args):
+            # cookie等dict参数转成可哈希的元组作为缓存键
+            key = tuple(tuple(sorted(a.items())) if isinstance(a, dict) else a for a in args)
+            now = time.monotonic()
+            with lock:
+                hit = cache.get(key)
+                if hit is not None and hit[0] > now:
+                    cache.move_to_end(key)
+                    return hit[1]
+                future = inflight.get(key)
+                owner = future is None
+                if owner:
+                    future = inflight[key] = Future()
+            if not owner:
+                return future.result()
+            try:
+                value = func(*args)
+            except BaseException as e:
+                with lock:
+                    del inflight[key]
+                future.set_exception(e)
+                raise
+            with lock:
+                del inflight[key]
+                if cacheable(value):
+                    cache[key] = (now + ttl, value)
+                    cache.move_to_end(key)
+                    if len(cache) > maxsize:
+                        cache.popitem(last=False)
+            future.set_result(value)
+            return value
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
+def song_url_ok(value):
+    return response_ok(value) and bool(value.get('data'))
+
+@ttl_cache(60, cacheable=song_url_ok)
 def url_v1(id, level, cookies):
     url = "https://interface3.music.163.com/eapi/song/enhance/player/url/v1"
     AES_KEY = b"e82ckenh8dichen8"
@@ -117,38 +239,54 @@ def url_v1(id, level, cookies):
     response = post(url, params, cookies)
     return json.loads(response)
 
+def song_detail_ok(value):
+    return response_ok(value) and bool(value.get('songs'))
+
+@ttl_cache(300, cacheable=song_detail_ok)
 def name_v1(id):
     #歌曲信息接口
     urls = "https://interface3.music.163.com/api/v3/song/detail"
     data = {'c': json.dumps([{"id":id,"v":0}])}
-    response = requests.post(url=urls, data=data)
+    response = session.post(url=urls, data=data, timeout=UPSTREAM_TIMEOUT)
     return response.json()
 
+@ttl_cache(3600)
 def lyric_v1(id,cookies):
     #歌词接口
     url = "https://interface3.music.163.com/api/song/lyric"
     data = {'id' : id,'cp' : 'false','tv' : '0','lv' : '0','rv' : '0','kv' : '0','yv' : '0','ytv' : '0','yrv' : '0'}
-    response = requests.post(url=url, data=data, cookies=cookies)
+    response = session.post(url=url, data=data, cookies=cookies, timeout=UPSTREAM_TIMEOUT)
     return response.json()
 
 app = Flask(__name__)
 
+@app.after_request
+def compress_response(response):
+    # 客户端支持时对较大的JSON/文本响应做gzip压缩
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES
+            or request.accept_encodings['gzip'] <= 0):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(data, 5))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
 @app.route('/')
 def hello_world():
     return '你好，世界！'
 
 @app.route('/Song_V1', methods=['GET', 'POST'])
 def Song_v1():
-    if request.method == 'GET':
-        song_ids = request.args.get('ids')
-        url = request.args.get('url')
-        level = request.args.get('level')
-        type_ = request.args.get('type')
-    else:
-        song_ids = request.form.get('ids')
-        url = request.form.get('url')
-        level = request.form.get('level')
-        type_ = request.form.get('type')
+    params = request.args if request.method == 'GET' else request.form
+    song_ids = params.get('ids')
+    url = params.get('url')
+    level = params.get('level')
+    type_ = params.get('type')
 
     if not song_ids and not url:
         return jsonify({'error': '必须提供 ids 或 url 参数'}), 400
@@ -156,12 +294,23 @@ def Song_v1():
         return jsonify({'error': 'level参数为空'}), 400
     if type_ is None:
         return jsonify({'error': 'type参数为空'}), 400
+    if level not in VALID_LEVELS:
+        return jsonify({'error': VALID_LEVELS_MSG}), 400
+    if type_ not in VALID_TYPES:
+        return jsonify({'error': VALID_TYPES_MSG}), 400
 
     jsondata = song_ids if song_ids else url
-    cookies = parse_cookie(read_cookie())
-    urlv1 = url_v1(ids(jsondata),level,cookies)
-    namev1 = name_v1(urlv1['data'][0]['id'])
-    lyricv1 = lyric_v1(urlv1['data'][0]['id'],cookies)
+    cookies = get_cookies()
+    song_id = ids(jsondata)
+    if not song_id or not (song_id.isascii() and song_id.isdigit()):
+        return jsonify({'error': '无法解析歌曲ID，请检查 ids 或 url 参数'}), 400
+    music_id = int(song_id)
+    # 三个接口互不依赖，并发请求；url_v1直接在请求线程里执行
+    name_future = executor.submit(name_v1, music_id)
+    lyric_future = executor.submit(lyric_v1, music_id, cookies)
+    urlv1 = url_v1(song_id, level, cookies)
+    namev1 = name_future.result()
+    lyricv1 = lyric_future.result()
     if urlv1['data'][0]['url'] is not None:
         if namev1['songs']:
            song_url = urlv1['data'][0]['url']
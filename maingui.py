@@ -1,155 +1,35 @@
-from flask import Flask, request, render_template, jsonify, Response
-import json
-import os
-import urllib.parse
+from flask import Flask, request, jsonify, Response
+import gzip
+from functools import lru_cache
 from hashlib import md5
-from random import randrange
-import requests
-from cryptography.hazmat.primitives import padding
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from flask_wtf import FlaskForm
-from wtforms import StringField, SelectField, SubmitField
-from wtforms.validators import DataRequired
+from main import (get_cookies, ids, url_v1, name_v1, lyric_v1, size, music_level1, executor,
+                  compress_response, VALID_LEVELS, VALID_LEVELS_MSG)
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your_secret_key'
+app.after_request(compress_response)
 
-# 定义表单类
-class SongForm(FlaskForm):
-    song_ids = StringField('Song ID or URL', validators=[DataRequired()])
-    level = SelectField('Quality Level', choices=[
-        ('standard', '标准音质'),
-        ('exhigh', '极高音质'),
-        ('lossless', '无损音质'),
-        ('hires', 'Hires音质'),
-        ('sky', '沉浸环绕声'),
-        ('jyeffect', '高清环绕声'),
-        ('jymaster', '超清母带'),
-    ], validators=[DataRequired()])
-    submit = SubmitField('Submit')
-
-def HexDigest(data):
-    return "".join([hex(d)[2:].zfill(2) for d in data])
-
-def HashDigest(text):
-    HASH = md5(text.encode("utf-8"))
-    return HASH.digest()
-
-def HashHexDigest(text):
-    return HexDigest(HashDigest(text))
-
-def parse_cookie(text: str):
-    cookie_ = [item.strip().split('=', 1) for item in text.strip().split(';') if item]
-    cookie_ = {k.strip(): v.strip() for k, v in cookie_}
-    return cookie_
-
-def ids(ids):
-    if '163cn.tv' in ids:
-        response = requests.get(ids, allow_redirects=False)
-        ids = response.headers.get('Location')
-    if 'music.163.com' in ids:
-        index = ids.find('id=') + 3
-        ids = ids[index:].split('&')[0]
-    return ids
-
-def read_cookie():
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    cookie_file = os.path.join(script_dir, 'cookie.txt')
-    with open(cookie_file, 'r') as f:
-        cookie_contents = f.read()
-    return cookie_contents
-
-def post(url, params, cookie):
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Safari/537.36 Chrome/91.0.4472.164 NeteaseMusicDesktop/2.10.2.200154',
-        'Referer': '',
-    }
-    cookies = {
-        "os": "pc",
-        "appver": "",
-        "osver": "",
-        "deviceId": "pyncm!"
-    }
-    cookies.update(cookie)
-    response = requests.post(url, headers=headers, cookies=cookies, data={"params": params})
-    return response.text
-
-def size(value):
-    units = ["B", "KB", "MB", "GB", "TB", "PB"]
-    size = 1024.0
-    for i in range(len(units)):
-        if (value / size) < 1:
-            return "%.2f%s" % (value, units[i])
-        value = value / size
-    return value
-
-def music_level1(value):
-    if value == 'standard':
-        return "标准音质"
-    elif value == 'exhigh':
-        return "极高音质"
-    elif value == 'lossless':
-        return "无损音质"
-    elif value == 'hires':
-        return "Hires音质"
-    elif value == 'sky':
-        return "沉浸环绕声"
-    elif value == 'jyeffect':
-        return "高清环绕声"
-    elif value == 'jymaster':
-        return "超清母带"
-    else:
-        return "未知音质"
-
-def url_v1(id, level, cookies):
-    url = "https://interface3.music.163.com/eapi/song/enhance/player/url/v1"
-    AES_KEY = b"e82ckenh8dichen8"
-    config = {
-        "os": "pc",
-        "appver": "",
-        "osver": "",
-        "deviceId": "pyncm!",
-        "requestId": str(randrange(20000000, 30000000))
-    }
-
-    payload = {
-        'ids': [id],
-        'level': level,
-        'encodeType': 'flac',
-        'header': json.dumps(config),
-    }
-
-    if level == 'sky':
-        payload['immerseType'] = 'c51'
-    
-    url2 = urllib.parse.urlparse(url).path.replace("/eapi/", "/api/")
-    digest = HashHexDigest(f"nobody{url2}use{json.dumps(payload)}md5forencrypt")
-    params = f"{url2}-36cd479b6b5-{json.dumps(payload)}-36cd479b6b5-{digest}"
-    padder = padding.PKCS7(algorithms.AES(AES_KEY).block_size).padder()
-    padded_data = padder.update(params.encode()) + padder.finalize()
-    cipher = Cipher(algorithms.AES(AES_KEY), modes.ECB())
-    encryptor = cipher.encryptor()
-    enc = encryptor.update(padded_data) + encryptor.finalize()
-    params = HexDigest(enc)
-    response = post(url, params, cookies)
-    return json.loads(response)
-
-def name_v1(id):
-    urls = "https://interface3.music.163.com/api/v3/song/detail"
-    data = {'c': json.dumps([{"id":id,"v":0}])}
-    response = requests.post(url=urls, data=data)
-    return response.json()
-
-def lyric_v1(id, cookies):
-    url = "https://interface3.music.163.com/api/song/lyric"
-    data = {'id': id, 'cp': 'false', 'tv': '0', 'lv': '0', 'rv': '0', 'kv': '0', 'yv': '0', 'ytv': '0', 'yrv': '0'}
-    response = requests.post(url=url, data=data, cookies=cookies)
-    return response.json()
+@lru_cache(maxsize=1)
+def index_page():
+    # 页面是纯静态的，只读取、gzip压缩并计算ETag一次
+    with app.open_resource('templates/index.html') as f:
+        html = f.read()
+    html_gz = gzip.compress(html, 9)
+    return (html, md5(html).hexdigest()), (html_gz, md5(html_gz).hexdigest())
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
-    form = SongForm()
-    return render_template('index.html', form=form)
+    plain, compressed = index_page()
+    if request.accept_encodings['gzip'] > 0:
+        body, etag = compressed
+        response = Response(body, mimetype='text/html')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        body, etag = plain
+        response = Response(body, mimetype='text/html')
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response.make_conditional(request)
 
 @app.route('/fetch_data', methods=['POST'])
 def fetch_data():
@@ -158,12 +38,20 @@ def fetch_data():
 
     if not song_ids or not level:
         return jsonify({"status": 400, "msg": "缺少参数！"})
+    if level not in VALID_LEVELS:
+        return jsonify({"status": 400, "msg": VALID_LEVELS_MSG})
 
-    cookies = parse_cookie(read_cookie())
+    cookies = get_cookies()
     song_id = ids(song_ids)
+    if not song_id or not (song_id.isascii() and song_id.isdigit()):
+        return jsonify({"status": 400, "msg": "无法解析歌曲ID，请检查输入的ID或链接！"})
+    music_id = int(song_id)
+    # 三个接口互不依赖，并发请求；url_v1直接在请求线程里执行
+    name_future = executor.submit(name_v1, music_id)
+    lyric_future = executor.submit(lyric_v1, music_id, cookies)
     urlv1 = url_v1(song_id, level, cookies)
-    namev1 = name_v1(urlv1['data'][0]['id'])
-    lyricv1 = lyric_v1(urlv1['data'][0]['id'], cookies)
+    namev1 = name_future.result()
+    lyricv1 = lyric_future.result()
 
     if urlv1['data'][0]['url'] is not None:
         song_url = urlv1['data'][0]['url']